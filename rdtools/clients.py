@@ -1,39 +1,181 @@
 
 from rdtools.utils import print2
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import chain
 from os import path
-import numpy as np
-import tempfile
+import io
 import csv
+import operator
+import mimetypes
+import zipfile
 import molgenis.client as molgenis
-from requests_oauthlib import OAuth2Session
-from oauthlib.oauth2 import LegacyApplicationClient
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
 
 class Molgenis(molgenis.Session):
   def __init__(self, *args, **kwargs):
     super(Molgenis, self).__init__(*args, **kwargs)
+    retries = Retry(
+      total=3,
+      backoff_factor=0.3,
+      status_forcelist=[502, 503, 504],
+      raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=retries)
+    self._session.mount('https://', adapter)
+    self._session.mount('http://', adapter)
+    self._session.headers.update({'Connection': 'keep-alive'})
     self.fileImportEndpoint = f"{self._root_url}plugin/importwizard/importFile"
+    self.fileUploadEndpoint = f"{self._root_url}api/files"
+    self._importParams = {'action': 'add_update_existing', 'metadataAction': 'ignore'}
   
-  def _datatableToCsv(self, path, datatable):
+  def _datatableToCsv(self, file, datatable):
     """To CSV
-    Write datatable object as CSV file
+    Write datatable object as CSV using datatable's native (multithreaded)
+    writer. Boolean columns are written as True/False rather than 1/0 so
+    that they are parsed as booleans by MOLGENIS.
 
-    @param path location to save the file
+    @param file binary file-like object to write the file to
     @param data datatable object
     """
-    data = datatable.to_pandas().replace({np.nan: None})
-    data.to_csv(path, index=False, quoting=csv.QUOTE_ALL)
+    import datatable as dt
+    bools = [
+      name for name, stype in zip(datatable.names, datatable.stypes)
+      if stype == dt.bool8
+    ]
+    if bools:
+      datatable = datatable.copy()
+      datatable[:, bools] = dt.str32
+    file.write(datatable.to_csv(quoting='minimal').encode('utf-8'))
     
-  def _dfToCsv(self, path, df):
+  def _dfToCsv(self, file, df):
     """To CSV
     Write pandas dataframe as CSV file
 
-    @param path location to save the file
+    @param file binary file-like object to write the file to
     @param df pandas data.frame
     """
-    data = df.replace({np.nan: None})
-    data.to_csv(path, index=False, quoting=csv.QUOTE_ALL)
+    # pandas < 1.2 can only write to text handles
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+    df.to_csv(text, index=False, quoting=csv.QUOTE_MINIMAL, na_rep='')
+    text.flush()
+    text.detach()
+
+  def _uploadCsv(self, pkg_entity: str, file, compress: bool=False):
+    """Upload CSV
+    Post a CSV file to the importFile api
+
+    @param pkg_entity table identifier in emx format: package_entity
+    @param file binary file-like object containing the CSV
+    @param compress If True, the CSV is sent as a deflated zip archive
+
+    @return response
+    """
+    upload = (f"{pkg_entity}.csv", file, 'text/csv')
+    if compress:
+      archive = io.BytesIO()
+      with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_DEFLATED) as zf, file.getbuffer() as data:
+        zf.writestr(f"{pkg_entity}.csv", data)
+      upload = (f"{pkg_entity}.zip", archive, 'application/zip')
+    upload[1].seek(0)
+    return self._session.post(
+      url = self.fileImportEndpoint,
+      headers = self._headers.token_header,
+      files = {'file': upload},
+      params = self._importParams
+    )
+
+  def _prefetchCsv(self, chunks, toCsv):
+    """Prefetch CSV
+    Serialize table slices in a background thread, one slice ahead of the
+    consumer, so that writing the next CSV overlaps with uploading the
+    current one. A single slice is serialized in the calling thread. Since
+    serialization never runs more than one slice ahead, memory use is
+    bounded by a few slices (including the multipart copy requests builds
+    for each upload) regardless of the size of the table. Close the
+    generator when stopping early.
+
+    @param chunks iterable of table slices
+    @param toCsv method used to write a slice to a file-like object
+
+    @return generator of binary file-like objects
+    """
+    def serialize(chunk):
+      file = io.BytesIO()
+      toCsv(file, chunk)
+      return file
+
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    second = next(chunks, None)
+    if second is None:
+      if first is not None:
+        yield serialize(first)
+      return
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+      pending = executor.submit(serialize, first)
+      for chunk in chain([second], chunks):
+        future = executor.submit(serialize, chunk)
+        yield pending.result()
+        pending = future
+      yield pending.result()
+
+  def _importCsvChunks(self, pkg_entity: str, chunks, toCsv, compress: bool=False):
+    """Import CSV chunks
+    Serialize and upload each chunk of a table. The next chunk is serialized
+    while the current one is uploaded. Stops at the first failed request.
+
+    @param pkg_entity table identifier in emx format: package_entity
+    @param chunks iterable of table slices
+    @param toCsv method used to write a slice to a file-like object
+    @param compress If True, each chunk is sent as a deflated zip archive
+
+    @return response (of the last request or the first failed request)
+    """
+    with closing(self._prefetchCsv(chunks, toCsv)) as files:
+      for file in files:
+        response = self._uploadCsv(pkg_entity, file, compress)
+        file.close()
+        if not response.ok:
+          print2('Failed to import data into',pkg_entity,'(',response.status_code,')')
+          return response
+    print2('Imported data into', pkg_entity)
+    return response
+
+  def _chunkRows(self, nrows: int, chunk_rows: int=None) -> list:
+    """Chunk rows
+    Compute the row ranges of the chunks a table is imported in
+
+    @param nrows number of rows in the table
+    @param chunk_rows maximum number of rows per chunk. If None, the table
+      is imported as a single chunk.
+
+    @return list of (start, stop) row ranges
+    """
+    if chunk_rows is None:
+      return [(0, nrows)]
+    error = f"chunk_rows must be a positive integer or None, not {chunk_rows!r}"
+    if isinstance(chunk_rows, bool):
+      raise ValueError(error)
+    try:
+      chunk_rows = operator.index(chunk_rows)
+    except TypeError:
+      raise ValueError(error) from None
+    if chunk_rows < 1:
+      raise ValueError(error)
+    return [
+      (start, start + chunk_rows)
+      for start in range(0, max(nrows, 1), chunk_rows)
+    ]
   
-  def importDatatableAsCsv(self, pkg_entity: str, data):
+  def importDatatableAsCsv(self, pkg_entity: str, data, chunk_rows: int=None, compress: bool=False):
     """Import Datatable As CSV
     Save a datatable object to as csv file and import into MOLGENIS using the
     importFile api.
@@ -44,26 +186,25 @@ class Molgenis(molgenis.Session):
     
     @param pkg_entity table identifier in emx format: package_entity
     @param data a datatable object
+    @param chunk_rows maximum number of rows per import. If set, larger
+      datatables are split and imported in consecutive requests to limit memory
+      usage. By default, all rows are imported in a single request. Each
+      chunk is a separate import job: importing stops at the first request
+      that is rejected, but a chunk that is accepted and then fails during
+      the import is not detected, which may leave the table partially
+      imported. Check sys_Imports for the status of each job.
+    @param compress If True, the csv file is zipped before it is uploaded.
+      This reduces the upload size (typically 5-10x) at a small CPU cost.
     
-    @return status message
+    @return status message (of the last request or the first failed request)
     """
-    with tempfile.TemporaryDirectory() as tmpdir:
-      filepath=f"{tmpdir}/{pkg_entity}.csv"
-      self._datatableToCsv(filepath, data)
-      with open(path.abspath(filepath), 'r') as file:
-        response = self._session.post(
-          url = self.fileImportEndpoint,
-          headers = self._headers.token_header,
-          files = {'file': file},
-          params = {'action': 'add_update_existing', 'metadataAction': 'ignore'}
-        )
-        if (response.status_code // 100 ) != 2:
-          print2('Failed to import data into',pkg_entity,'(',response.status_code,')')
-        else:
-          print2('Imported data into', pkg_entity)
-        return response
+    chunks = (
+      data[start:stop, :]
+      for start, stop in self._chunkRows(data.nrows, chunk_rows)
+    )
+    return self._importCsvChunks(pkg_entity, chunks, self._datatableToCsv, compress)
       
-  def importPandasAsCsv(self, pkg_entity, data):
+  def importPandasAsCsv(self, pkg_entity, data, chunk_rows: int=None, compress: bool=False):
     """Import Pandas data.frame As CSV
     Save a datatable object to as csv file and import into MOLGENIS using the
     importFile api.
@@ -74,25 +215,79 @@ class Molgenis(molgenis.Session):
     
     @param pkg_entity table identifier in emx format: package_entity
     @param data a python data.frame
+    @param chunk_rows maximum number of rows per import. If set, larger
+      data.frames are split and imported in consecutive requests to limit memory
+      usage. By default, all rows are imported in a single request. Each
+      chunk is a separate import job: importing stops at the first request
+      that is rejected, but a chunk that is accepted and then fails during
+      the import is not detected, which may leave the table partially
+      imported. Check sys_Imports for the status of each job.
+    @param compress If True, the csv file is zipped before it is uploaded.
+      This reduces the upload size (typically 5-10x) at a small CPU cost.
     
-    @return status message
+    @return status message (of the last request or the first failed request)
     """
-    with tempfile.TemporaryDirectory() as tmpdir:
-      filepath=f"{tmpdir}/{pkg_entity}.csv"
-      self._dfToCsv(filepath, data)
-      with open(path.abspath(filepath), 'r') as file:
-        response = self._session.post(
-          url=self.fileImportApi,
-          headers = self._headers.token_header,
-          files={'file': file},
-          params = {'action': 'add_update_existing', 'metadataAction': 'ignore'}
-        )
-        
-        if (response.status_code // 100) != 2:
-          print2('Failed to import data into',pkg_entity,'(',response.status_code,')')
-        else:
-          print2('Imported data into',pkg_entity)
-      return response
+    chunks = (
+      data.iloc[start:stop]
+      for start, stop in self._chunkRows(len(data), chunk_rows)
+    )
+    return self._importCsvChunks(pkg_entity, chunks, self._dfToCsv, compress)
+
+  def importFile(self, file: str):
+    """Import File
+    Upload a file into MOLGENIS using the files api. The file is streamed
+    from disk in chunks rather than read into memory first.
+
+    @param file path to the file to upload
+
+    @return response
+    """
+    filename = path.basename(file)
+    headers = {
+      **self._headers.token_header,
+      'x-molgenis-filename': filename,
+      'Content-Type': mimetypes.guess_type(file)[0] or 'application/octet-stream'
+    }
+    with open(file, 'rb') as stream:
+      response = self._session.post(
+        url = self.fileUploadEndpoint,
+        headers = headers,
+        data = stream
+      )
+    if not response.ok:
+      print2('Failed to upload',filename,'(',response.status_code,')')
+    else:
+      print2('Uploaded', filename)
+    return response
+
+  def importManyDatatables(self, items: list, max_workers: int=8) -> list:
+    """Import many Datatables As CSV
+    Import several datatable objects concurrently using a pool of threads.
+    See `importDatatableAsCsv` for more information.
+
+    @param items list of (pkg_entity, data) pairs
+    @param max_workers maximum number of concurrent imports
+
+    @return list of responses (same order as `items`)
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      return list(executor.map(
+        lambda item: self.importDatatableAsCsv(*item),
+        items
+      ))
+
+  def importManyFiles(self, files: list, max_workers: int=8) -> list:
+    """Import many Files
+    Upload several files concurrently using a pool of threads. See
+    `importFile` for more information.
+
+    @param files list of paths to the files to upload
+    @param max_workers maximum number of concurrent uploads
+
+    @return list of responses (same order as `files`)
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      return list(executor.map(self.importFile, files))
 
 
 class Alissa:
@@ -111,9 +306,27 @@ class Alissa:
     @reference Alissa Interpret Public API documentation v5.3
     @return class
     """
+    from requests_oauthlib import OAuth2Session
+    from oauthlib.oauth2 import LegacyApplicationClient
+
     self.host=host
     self.apiUrl=f"{host}/interpret/api/2"
     self.session=OAuth2Session(client=LegacyApplicationClient(client_id=clientId))
+    retries=Retry(
+      total=5,
+      backoff_factor=0.5,
+      status_forcelist=[429, 500, 502, 503, 504],
+      allowed_methods=['GET'],
+      raise_on_status=False
+    )
+    adapter=HTTPAdapter(pool_maxsize=64, max_retries=retries)
+    self.session.mount('https://', adapter)
+    self.session.mount('http://', adapter)
+    self.session.headers.update({
+      'Connection': 'keep-alive',
+      'Accept': 'application/json',
+      'Accept-Encoding': 'gzip, deflate'
+    })
     self.session.fetch_token(
       token_url=f"{host}/auth/oauth/token",
       username=username,
@@ -134,11 +347,24 @@ class Alissa:
     @param params dictionary containg one or more parameter
     @return dict
     """
-    return {
-      key: params[key]
-      for key in params.keys()
-      if (key != 'self') and (params[key] is not None)
-    }
+    return {key: value for key, value in params.items() if value is not None}
+
+  def _json(self, response):
+    """JSON
+    Decode a response body. orjson is used when installed (faster on large
+    variant exports). Bodies orjson rejects (e.g. containing NaN) are passed
+    to requests' built-in decoder, so results and errors are the same with
+    or without orjson.
+
+    @param response requests response object
+    @return json
+    """
+    if orjson is not None:
+      try:
+        return orjson.loads(response.content)
+      except orjson.JSONDecodeError:
+        pass
+    return response.json()
   
   def _get(self, endpoint, params=None, **kwargs):
     """GET
@@ -149,7 +375,7 @@ class Alissa:
     uri = f'{self.apiUrl}/{endpoint}'
     response = self.session.get(uri, params=params, **kwargs)
     response.raise_for_status()
-    return response.json()
+    return self._json(response)
       
   def _post(self, endpoint, data=None, json=None, **kwargs):
     """POST
@@ -161,7 +387,7 @@ class Alissa:
     uri = f'{self.apiUrl}/{endpoint}'
     response = self.session.post(uri, data, json, **kwargs)
     response.raise_for_status()
-    return response.json()
+    return self._json(response)
 
   def getPatientByInternalId(self, patientId: str = None):
     """Get Patient By ID
@@ -171,10 +397,7 @@ class Alissa:
     @param patientId the unique internal identifier of a patient (Alissa ID)
     @return json
     """
-    url = f'{self.apiUrl}/patients/{patientId}'
-    response = self.session.get(url)
-    response.raise_for_status()
-    return response.json()
+    return self._get(endpoint=f"patients/{patientId}")
 
   def getPatients(
     self,
@@ -207,7 +430,16 @@ class Alissa:
     @reference Alissa Interpret Public API (v5.3; p21)
     @return dictionary containing one or more patient records
     """
-    params = self._formatOptionalParams(params=locals())
+    params = self._formatOptionalParams(params={
+      'accessionNumber': accessionNumber,
+      'createdAfter': createdAfter,
+      'createdBefore': createdBefore,
+      'createdBy': createdBy,
+      'familyIdentifier': familyIdentifier,
+      'lastUpdatedAfter': lastUpdatedAfter,
+      'lastUpdatedBefore': lastUpdatedBefore,
+      'lastUpdatedBy': lastUpdatedBy
+    })
     return self._get(endpoint='patients', params=params)
 
   def getPatientAnalyses(self, patientId: str) -> dict:
@@ -220,6 +452,19 @@ class Alissa:
     """
     return self._get(endpoint=f"patients/{patientId}/analyses")
 
+  def getPatientAnalysesBulk(self, patientIds: list, max_workers: int=16) -> list:
+    """Get Analyses of Patients (bulk)
+    Retrieve the analyses of many patients concurrently. Requests are sent
+    in parallel using a pool of threads and share the session's connections.
+
+    @param patientIds list of unique internal identifiers of patients
+    @param max_workers maximum number of concurrent requests
+
+    @return list of analyses per patient (same order as `patientIds`)
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      return list(executor.map(self.getPatientAnalyses, patientIds))
+
   def getPatientVariantExportId(
     self,
     analysisId: int,
@@ -257,3 +502,20 @@ class Alissa:
     """
     api=f"patient_analyses/{analysisId}/molecular_variants/exports/{exportId}"
     return self._get(endpoint=api)
+
+  def getPatientVariantExportDataBulk(self, exports: list, max_workers: int=16) -> list:
+    """Get Patient Molecular Variants Export (bulk)
+    Retrieve the exported variants of many patient analyses concurrently.
+    Requests are sent in parallel using a pool of threads and share the
+    session's connections.
+
+    @param exports list of (analysisId, exportId) pairs
+    @param max_workers maximum number of concurrent requests
+
+    @return list of molecular variant export data (same order as `exports`)
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      return list(executor.map(
+        lambda export: self.getPatientVariantExportData(*export),
+        exports
+      ))
@@ -1,16 +1,34 @@
 from datetime import datetime
-from pytz import timezone
+from typing import Any, Dict, List, Optional
+import sys
+import time
 
-def now(tz='Europe/Amsterdam'):
+if sys.version_info >= (3, 9):
+  from zoneinfo import ZoneInfo
+else:
+  from backports.zoneinfo import ZoneInfo
+
+_TZ = ZoneInfo('Europe/Amsterdam')
+
+def _formatTime(dt: datetime) -> str:
+  """Format Time
+  Format a datetime object as HH:MM:SS.fff without parsing a strftime pattern
+
+  @param dt datetime object
+  @return time string
+  """
+  return f'{dt.hour:02d}:{dt.minute:02d}:{dt.second:02d}.{dt.microsecond // 1000:03d}'
+
+def now(tz: Optional[str]=None) -> str:
  """Now
  Return a timestamp formated as HH:MM:SSS
 
- @param tz timezone
+ @param tz timezone (default: 'Europe/Amsterdam')
  @return time string
  """
- return datetime.now(tz=timezone(tz)).strftime('%H:%M:%S.%f')[:-3]
+ return _formatTime(datetime.now(tz=ZoneInfo(tz) if tz else _TZ))
 
-def print2(*args):
+def print2(*args) -> None:
   """Print2
   Extension of print but all messages are printed with a timestamp. By default,
   the timezone is 'Europe/Amsterdam'.
@@ -24,10 +42,10 @@ def print2(*args):
   ```
   """
   message = ' '.join(map(str, args))
-  print(f'[{now()}] {message}')
+  sys.stdout.write(f'[{now()}] {message}\n')
   
 class Logger:
-  def __init__(self, logname: str=None, silent=False, printWithTime=True):
+  def __init__(self, logname: Optional[str]=None, silent: bool=False, printWithTime: bool=True):
     """Cosas Logger
     Keep records of all processing steps and summarize the daily imports
 
@@ -35,45 +53,61 @@ class Logger:
     @param silent : If True, all messages will be disabled
     @param printWithTime: If True and silent is False, all messages will be printed with timestamps
     """
-    self.silent = silent
     self.logname = logname
-    self.log = {}
-    self.currentStep = {}
-    self.stepLogs = []
+    self.log: Dict[str, Any] = {}
+    self.currentStep: Dict[str, Any] = {}
+    self.stepLogs: List[Dict[str, Any]] = []
+    self._appendStepLog = self.stepLogs.append
+    self._startedAt: Dict[str, float] = {}
     self._printWithTime = printWithTime
     self.tz = 'Europe/Amsterdam'
+    self._tz = _TZ
     self.hhmmss = '%H:%M:%S'
     self.hhmmss_f = '%H:%M:%S.%f'
     self.yyyymmdd_hhmmss = '%Y-%m-%dT%H:%M:%SZ'
+    self.silent = silent
+
+  @property
+  def silent(self) -> bool:
+    """If True, all messages are disabled"""
+    return self._silent
+
+  @silent.setter
+  def silent(self, silent: bool) -> None:
+    self._silent = silent
+    self._printTimestamp = self._printWithTime and not silent
+    self._print = self._printNothing if silent else self._printMessage
+
+  def _now(self) -> datetime:
+    return datetime.now(tz=self._tz)
 
-  def _now(self, strftime=None):
-    if strftime:
-      return datetime.now(tz=timezone(self.tz)).strftime(strftime)
-    return datetime.now(tz=timezone(self.tz))
+  def _printNothing(self, *message) -> None:
+    pass
 
-  def _print(self, *message):
-    if not self.silent:
-      message = ' '.join(map(str, message))
-      if self._printWithTime:
-        message = f"[{self._now(strftime=self.hhmmss_f)[:-3]}] {message}"
-      print(message)
+  def _printMessage(self, *message) -> None:
+    text = ' '.join(map(str, message))
+    if self._printTimestamp:
+      text = f"[{_formatTime(self._now())}] {text}"
+    sys.stdout.write(f"{text}\n")
 
-  def __stoptime__(self, name):
+  def __stoptime__(self, name: str) -> None:
     log = self.__getattribute__(name)
-    log['endTime'] = self._now()
-    log['elapsedTime'] = (log['endTime'] - log['startTime']).total_seconds()
-    log['endTime'] = log['endTime'].strftime(self.yyyymmdd_hhmmss)
+    log['elapsedTime'] = time.monotonic() - self._startedAt.pop(name)
+    log['endTime'] = self._now().strftime(self.yyyymmdd_hhmmss)
     log['startTime'] = log['startTime'].strftime(self.yyyymmdd_hhmmss)
     self.__setattr__(name, log)
 
-  def start(self):
+  def start(self) -> None:
     """Start Log"""
+    startTime = self._now()
+    self._startedAt['log'] = time.monotonic()
+    date = startTime.strftime('%Y-%m-%d')
     self.log = {
-      'identifier': self._now(strftime='%Y-%m-%d'),
+      'identifier': date,
       'name': self.logname,
-      'date': self._now(strftime='%Y-%m-%d'),
+      'date': date,
       'databaseName': 'cosas',
-      'startTime': self._now(),
+      'startTime': startTime,
       'endTime': None,
       'elapsedTime': None,
       'steps': [],
@@ -81,13 +115,13 @@ class Logger:
     }
     self._print(self.logname,': log started at',self.log['startTime'].strftime(self.hhmmss))
 
-  def stop(self):
+  def stop(self) -> None:
     """Stop Log"""
     self.__stoptime__(name='log')
     self.log['steps'] = ','.join(map(str, self.log['steps']))
     self._print('Logging stopped (elapsed time:', self.log['elapsedTime'], 'seconds')
 
-  def startStep(self, type: str = None, name: str = None, tablename: str = None):
+  def startStep(self, type: Optional[str] = None, name: Optional[str] = None, tablename: Optional[str] = None) -> None:
     """Start a new log for a processing step
     Create a new logging object for an individual step such as transforming
     data or importing data.
@@ -97,13 +131,15 @@ class Logger:
     @param tablename : database table the current step relates to
     """
     stepID = len(self.stepLogs) + 1
+    startTime = self._now()
+    self._startedAt['currentStep'] = time.monotonic()
     self.currentStep = {
-      'identifier': int(f"{self._now(strftime='%Y%m%d')}{stepID}"),
-      'date': self._now(strftime='%Y-%m-%d'),
+      'identifier': int(f"{startTime.strftime('%Y%m%d')}{stepID}"),
+      'date': startTime.strftime('%Y-%m-%d'),
       'name': name,
       'step': type,
       'databaseTable': tablename,
-      'startTime': self._now(),
+      'startTime': startTime,
       'endTime': None,
       'elapsedTime': None,
       'status': None,
@@ -111,11 +147,11 @@ class Logger:
     }
     self._print(self.logname, ': starting step', name)
 
-  def stopStep(self):
+  def stopStep(self) -> None:
     """Stop a log for a processing step"""
     self.__stoptime__(name='currentStep')
     self.log['steps'].append(self.currentStep['identifier'])
-    self.stepLogs.append(self.currentStep)
+    self._appendStepLog(self.currentStep)
     self._print(
       self.logname, ': finished step',
       self.currentStep['name'],'in',
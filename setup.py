@@ -14,15 +14,17 @@ VERSION = '0.1.0'
 # What packages are required for this module to be executed?
 REQUIRED = [
   'molgenis-py-client >= 2.4.0',
-  'pytz >= 2022.7.1',
-  'numpy >= 1.24.2',
+  'backports.zoneinfo; python_version < "3.9"',
+  'tzdata',
+  'requests >= 2.25.0',
+  'urllib3 >= 1.26.0',
   'requests_oauthlib >= 1.3.1',
   'oauthlib >= 3.2.2',
 ]
 
 # What packages are optional?
 EXTRAS = {
-  # 'fancy feature': ['django'],
+  'orjson': ['orjson >= 3.8.0'],
 }
 
 # The rest you shouldn't have to touch too much :)
@@ -101,6 +103,7 @@ setup(
     exclude=['tests','*.tests','*.tests.*', 'tests.*'],
   ),
   install_requires = REQUIRED,
+  extras_require = EXTRAS,
   classifiers=[
     # Trove classifiers
     # Full list: https://pypi.python.org/pypi?%3Aaction=list_classifiers